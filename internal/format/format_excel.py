@@ -1,17 +1,46 @@
 #!/usr/bin/env python3
+import argparse
 import json
 import sys
 import os
 import re
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Tuple
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 import shutil
+import zipfile
+import xml.etree.ElementTree as ET
+from copy import copy
+from io import BytesIO
 import logging
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+try:
+    import orjson  # Optional, parses the mapping JSON several times faster
+except ImportError:
+    orjson = None
 
+
+class InputError(Exception):
+    """An input, target or mapping file is missing or cannot be used"""
+
+
+class DiskSpaceError(InputError):
+    """Not enough free disk space for the outputs, raised before any sheet is formatted"""
+
+
+class FormatError(Exception):
+    """Formatting a sheet failed"""
+
+
+# HTML/XML tags in header cells, both self-closing and regular tags
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+
+@lru_cache(maxsize=4096)
 def clean_column_name(raw_name: str) -> str:
     """Clean column names by removing HTML tags, extra whitespace, and taking first line"""
     if not raw_name:
@@ -20,22 +49,33 @@ def clean_column_name(raw_name: str) -> str:
     # Convert to string and strip basic whitespace
     cleaned = str(raw_name).strip()
     
-    # Remove HTML/XML tags using regex
-    # This handles both self-closing and regular tags
-    cleaned = re.sub(r'<[^>]+>', '', cleaned)
+    # Remove HTML/XML tags using the precompiled regex, most headers have none
+    if '<' in cleaned:
+        cleaned = HTML_TAG_RE.sub('', cleaned)
     
     # Split by newlines and take the first non-empty line
-    lines = [line.strip() for line in cleaned.split('\n') if line.strip()]
-    if lines:
-        cleaned = lines[0]
-    else:
-        cleaned = ""
+    if '\n' in cleaned:
+        lines = [line.strip() for line in cleaned.split('\n') if line.strip()]
+        if lines:
+            cleaned = lines[0]
+        else:
+            cleaned = ""
     
     # Remove extra whitespace and normalize
     cleaned = ' '.join(cleaned.split())
     
     return cleaned
 
+def is_blank(value) -> bool:
+    """True for None and whitespace-only strings; numbers, dates and booleans are never blank"""
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+# Detailed DEBUG logging to the log file is opt-in (SHEETFMT_DEBUG=1), so the per-column and
+# per-row debug messages are not even formatted in normal runs
+DEBUG = os.environ.get('SHEETFMT_DEBUG', '0').strip().lower() in ('1', 'true', 'yes')
+
+
 def setup_logging():
     """Setup logging configuration with Unicode support"""
     log_dir = Path("logs")
@@ -46,7 +86,7 @@ def setup_logging():
         log_dir / "format_excel.log", 
         encoding='utf-8'
     )
-    file_handler.setLevel(logging.DEBUG)
+    file_handler.setLevel(logging.DEBUG if DEBUG else logging.INFO)
     
     # Create console handler 
     console_handler = logging.StreamHandler(sys.stdout)
@@ -61,7 +101,7 @@ def setup_logging():
     
     # Setup logger
     logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
     logger.addHandler(file_handler)
     logger.addHandler(console_handler)
     
@@ -71,6 +111,117 @@ def setup_logging():
 logger = setup_logging()
 
 
+def load_input_workbook(input_file: str):
+    """Open an input workbook for reading calculated values only"""
+    # read_only streams the sheet XML instead of building every cell, data_only gives values not formulas,
+    # external links are never followed so their parts are not parsed
+    return load_workbook(input_file, read_only=True, data_only=True, keep_links=False)
+
+
+def read_sheet_names(xlsx_file: str) -> List[str]:
+    """List the sheet names of a workbook straight from its workbook.xml part, without
+    letting openpyxl parse shared strings and styles just to get the names"""
+    try:
+        with zipfile.ZipFile(xlsx_file) as archive:
+            # The package relationships point at the workbook part, usually xl/workbook.xml
+            workbook_part = "xl/workbook.xml"
+            rels = ET.fromstring(archive.read("_rels/.rels"))
+            for rel in rels:
+                if rel.get("Type", "").endswith("/officeDocument"):
+                    workbook_part = rel.get("Target").lstrip("/")
+                    break
+            
+            workbook = ET.fromstring(archive.read(workbook_part))
+            # Match on the local name, strict OOXML files use a different namespace
+            return [sheet.get("name") for sheet in workbook.iter() if sheet.tag.rsplit("}", 1)[-1] == "sheet"]
+    except (KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        logger.debug(f"Could not read sheet names from workbook.xml ({e}), falling back to openpyxl")
+    
+    names_wb = load_workbook(xlsx_file, read_only=True, keep_links=False)
+    try:
+        return names_wb.sheetnames
+    finally:
+        names_wb.close()
+
+
+def load_mapping_config(mapping_file: str) -> dict:
+    """Read the column mapping JSON"""
+    # Check if mapping file exists
+    if not os.path.exists(mapping_file):
+        raise InputError(f"Mapping file not found: {mapping_file}")
+    
+    # Load mapping configuration with UTF-8 encoding
+    if orjson is not None:
+        with open(mapping_file, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_sheet_values(worksheet, strict_dimensions: bool = False) -> Tuple[List[tuple], Dict[Tuple[int, int], str]]:
+    """Read a read-only worksheet in a single pass: value tuples per row (index 0 is row 1)
+    and the non-General number formats keyed by (row, column)"""
+    rows = []
+    number_formats = {}
+    
+    # The stored <dimension> is written by whatever tool produced the file and can be wildly off
+    # (e.g. A1:XFD1048576), iterate the rows that are actually present unless told to trust it
+    if not strict_dimensions:
+        worksheet.reset_dimensions()
+    
+    for row_idx, row in enumerate(worksheet.iter_rows(), start=1):
+        rows.append(tuple(cell.value for cell in row))
+        for col_idx, cell in enumerate(row, start=1):
+            # Missing cells come back as EmptyCell whose number_format is None
+            number_format = cell.number_format
+            if number_format and number_format != 'General':
+                number_formats[(row_idx, col_idx)] = number_format
+    return rows, number_formats
+
+
+# Output directories, relative to the working directory the Go side runs us from
+RESULTS_DIR = Path("data/results")
+PROBLEMATIC_DIR = Path("data/problematic")
+
+# ioctl request number of FICLONE (Linux), clones a file on copy-on-write filesystems
+FICLONE = 0x40049409
+
+
+def reflink_file(src: str, dst: str) -> bool:
+    """Clone src to dst with a copy-on-write reflink, returns False when not supported"""
+    try:
+        import fcntl
+    except ImportError:
+        return False  # Not available on Windows
+    
+    try:
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        return False
+
+
+def mirror_file(src: str, dst: str):
+    """Put a copy of src at dst as cheaply as the filesystem allows:
+    hardlink, then reflink, then a full copy"""
+    try:
+        if os.path.exists(dst):
+            if os.path.samefile(src, dst):
+                return  # Already linked
+            os.remove(dst)
+        os.link(src, dst)
+        return
+    except OSError:
+        pass  # Cross-device, unsupported filesystem or no permission
+    
+    if reflink_file(src, dst):
+        return
+    
+    shutil.copy2(src, dst)
+
+
 def safe_print(text):
     """Print text with encoding error handling"""
     try:
@@ -83,7 +234,10 @@ def safe_print(text):
 class ExcelFormatter:
     def __init__(self, input_file: str, target_file: str, mapping_file: str, 
                  output_file: str, input_sheet: str, target_sheet: str, 
-                 table_end_tolerance: int = 1, clean_formula_only_rows: bool = True):
+                 table_end_tolerance: int = 1, clean_formula_only_rows: bool = True,
+                 input_wb=None, stream_output: bool = False,
+                 mapping_config: dict = None, target_bytes: bytes = None,
+                 strict_dimensions: bool = False):
         self.input_file = input_file
         self.target_file = target_file
         self.mapping_file = mapping_file
@@ -92,58 +246,65 @@ class ExcelFormatter:
         self.target_sheet_name = target_sheet
         self.table_end_tolerance = table_end_tolerance
         self.clean_formula_only_rows = clean_formula_only_rows
+        # Stream rows into a new write-only workbook instead of editing a copy of the template.
+        # Faster and flat in memory, but only the target sheet's header area and data are kept.
+        self.stream_output = stream_output
+        # Trust the <dimension> stored in read-only sheets instead of resetting it
+        self.strict_dimensions = strict_dimensions
         
-        self.input_wb = None
+        # Input workbook can be shared by the caller (format_all_sheets) so it is parsed only once
+        self.input_wb = input_wb
+        self.owns_input_wb = input_wb is None
         self.target_wb = None
         self.input_ws = None
         self.target_ws = None
         
-        self.mapping_config = None
+        # Mapping and raw target file can also be preloaded once for all sheets
+        self.mapping_config = mapping_config
+        self.target_bytes = target_bytes
         self.scanned_to_target = {}  # Changed: scanned -> target
         self.ignored_scanned = set()  # Changed: track ignored scanned columns
         self.error_messages = []
+        # Target rows the copy pass wrote non-empty data into, the cleanup keeps them without a scan
+        self.target_rows_with_data = set()
+        self.problematic_copied = False
+        
+        # Invariants used in log messages and the error path
+        self.input_basename = os.path.basename(input_file)
+        self.problematic_path = PROBLEMATIC_DIR / self.input_basename
         
     def load_files(self):
         """Load all required files"""
         try:
-            # Check if mapping file exists
-            if not os.path.exists(self.mapping_file):
-                raise Exception(f"Mapping file not found: {self.mapping_file}")
-            
-            # Load mapping configuration with UTF-8 encoding
-            with open(self.mapping_file, 'r', encoding='utf-8') as f:
-                self.mapping_config = json.load(f)
+            if self.mapping_config is None:
+                self.mapping_config = load_mapping_config(self.mapping_file)
             
             logger.debug(f"Loaded mapping file: {self.mapping_file}")
             logger.debug(f"Mapping config keys: {list(self.mapping_config.keys())}")
             
             # Create scanned -> target mapping and ignored set
-            mappings_count = 0
-            ignored_count = 0
+            mappings = self.mapping_config.get('mappings', [])
+            self.ignored_scanned = {
+                mapping['scanned_column'] for mapping in mappings if mapping.get('is_ignored', False)
+            }
+            # Changed: Now we map scanned -> target (can have multiple scanned for same target)
+            self.scanned_to_target = {
+                mapping['scanned_column']: mapping['target_column'] for mapping in mappings
+                if not mapping.get('is_ignored', False) and mapping.get('target_column')
+            }
             
-            for mapping in self.mapping_config.get('mappings', []):
-                scanned_col = mapping['scanned_column']
-                
-                if mapping.get('is_ignored', False):
-                    # Track ignored scanned columns
-                    self.ignored_scanned.add(scanned_col)
-                    ignored_count += 1
-                    logger.debug(f"Ignoring scanned column '{scanned_col}'")
-                elif mapping.get('target_column'):
-                    target_col = mapping['target_column']
-                    # Changed: Now we map scanned -> target (can have multiple scanned for same target)
-                    self.scanned_to_target[scanned_col] = target_col
-                    mappings_count += 1
-                    logger.debug(f"Mapping scanned '{scanned_col}' -> target '{target_col}'")
-            
-            logger.debug(f"Total mappings loaded: {mappings_count}")
-            logger.debug(f"Total ignored: {ignored_count}")
+            logger.debug(f"Total mappings loaded: {len(self.scanned_to_target)}")
+            logger.debug(f"Total ignored: {len(self.ignored_scanned)}")
             
             # Load Excel files
             # CHANGED: Load input file with data_only=True to get calculated values, not formulas
-            self.input_wb = load_workbook(self.input_file, data_only=True)
+            if self.input_wb is None:
+                self.input_wb = load_input_workbook(self.input_file)
             # Keep target file with data_only=False to preserve its structure
-            self.target_wb = load_workbook(self.target_file, data_only=False)
+            # When streaming the output the template is only read, so read_only is enough
+            # Every sheet edits its own copy, so a preloaded target is kept as bytes and parsed here
+            target_source = BytesIO(self.target_bytes) if self.target_bytes is not None else self.target_file
+            self.target_wb = load_workbook(target_source, data_only=False, read_only=self.stream_output)
             
             # Get worksheets
             logger.debug(f"Input sheets: {self.input_wb.sheetnames}")
@@ -152,37 +313,71 @@ class ExcelFormatter:
             self.input_ws = self.input_wb[self.input_sheet_name]
             self.target_ws = self.target_wb[self.target_sheet_name]
             
+            # Input is read-only and can only be streamed, so read it once up front
+            self.input_rows, self.input_number_formats = read_sheet_values(self.input_ws, self.strict_dimensions)
+            
+            # Snapshot the input height once, taken from the rows that were actually read
+            self.input_max_row = len(self.input_rows)
+            
+            # Target cell values row by row (index 0 is row 1), used for header detection.
+            # Read-only worksheets can only be iterated, so detection never uses ws.cell()
+            if self.stream_output and not self.strict_dimensions:
+                self.target_ws.reset_dimensions()
+            self.target_rows = list(self.target_ws.iter_rows(values_only=True))
+            
+            # Take the target dimensions from its rows, a read-only sheet without a <dimension>
+            # element reports max_row and max_column as None
+            self.target_max_row = len(self.target_rows)
+            self.target_max_col = max((len(row) for row in self.target_rows), default=0)
+            
+            # Column letters of the target sheet, indexed by column number
+            self.col_letters = [None] + [get_column_letter(col_idx) for col_idx in range(1, self.target_max_col + 1)]
+            
         except Exception as e:
             logger.error(f"Failed to load files: {e}")
-            raise Exception(f"Failed to load files: {e}")
+            raise InputError(f"Failed to load files: {e}")
+
+    def detect_rightmost_column(self, rows: List[tuple]) -> int:
+        """Find the rightmost column that has data in any row, 0 if there is no data"""
+        rightmost_col = 0
+        for row in rows:
+            for col_idx in range(len(row), 0, -1):
+                value = row[col_idx - 1]
+                if not is_blank(value):
+                    if col_idx > rightmost_col:
+                        rightmost_col = col_idx
+                    break  # Found the rightmost data in this row
+        return rightmost_col
 
-    def detect_table_end_row(self, worksheet, header_row: int) -> int:
+    def detect_table_end_row(self, rows: List[tuple], header_row: int, rightmost_col: int = None) -> int:
         """Detect where the data table ends by checking rightmost column continuity with tolerance"""
         
-        if worksheet.max_row == 0:
+        max_row = len(rows)
+        
+        if max_row == 0:
             return header_row  # No data, table ends at header
         
         # Find the rightmost column with data (same logic as header detection)
-        rightmost_col = 0
-        for row_idx in range(1, worksheet.max_row + 1):
-            for col_idx in range(worksheet.max_column, 0, -1):
-                cell = worksheet.cell(row=row_idx, column=col_idx)
-                if cell.value is not None and str(cell.value).strip() != "":
-                    if col_idx > rightmost_col:
-                        rightmost_col = col_idx
-                    break
+        if rightmost_col is None:
+            rightmost_col = self.detect_rightmost_column(rows)
         
         if rightmost_col == 0:
             return header_row  # No data found
         
         logger.debug(f"Using table end tolerance: {self.table_end_tolerance}")
         
+        # Data flag of the rightmost column per row (index 0 is row 1), computed once since the
+        # tolerance look-ahead below revisits the same rows
+        col_has_data = [
+            rightmost_col <= len(row) and not is_blank(row[rightmost_col - 1])
+            for row in rows
+        ]
+        
         # Starting from header row, find where table ends
         table_end_row = header_row
         
-        for row_idx in range(header_row, worksheet.max_row + 1):
-            current_cell = worksheet.cell(row=row_idx, column=rightmost_col)
-            current_has_data = current_cell.value is not None and str(current_cell.value).strip() != ""
+        for row_idx in range(header_row, max_row + 1):
+            current_has_data = col_has_data[row_idx - 1]
             
             if current_has_data:
                 # Check if next N rows (tolerance) have data in rightmost column
@@ -190,9 +385,8 @@ class ExcelFormatter:
                 
                 for check_offset in range(1, self.table_end_tolerance + 1):
                     check_row_idx = row_idx + check_offset
-                    if check_row_idx <= worksheet.max_row:
-                        check_cell = worksheet.cell(row=check_row_idx, column=rightmost_col)
-                        check_has_data = check_cell.value is not None and str(check_cell.value).strip() != ""
+                    if check_row_idx <= max_row:
+                        check_has_data = col_has_data[check_row_idx - 1]
                         
                         if not check_has_data:
                             empty_rows_count += 1
@@ -221,37 +415,44 @@ class ExcelFormatter:
         
         logger.debug("Starting formula-only and empty row cleanup...")
         
-        rows_to_delete = []
+        target_ws = self.target_ws
+        cells = target_ws._cells
+        
+        # Header row and rows that just received data are kept without looking at their cells
+        keep_rows = {self.target_header_row} | self.target_rows_with_data
         
-        # Check each row starting from row 1, but skip header row
-        for row_idx in range(1, self.target_ws.max_row + 1):
-            # Skip the header row
-            if row_idx == self.target_header_row:
+        # One sweep of the existing cells, missing cells are empty anyway.
+        # A cell with data that's not a formula (or just whitespace) keeps its row
+        for (row_idx, _), cell in cells.items():
+            if row_idx in keep_rows:
                 continue
-                
-            has_non_formula_data = False
-            
-            # Check all cells in this row
-            for col_idx in range(1, self.target_ws.max_column + 1):
-                cell = self.target_ws.cell(row=row_idx, column=col_idx)
-                
-                if cell.value is not None:
-                    # If cell contains data that's not a formula, keep the row
-                    if cell.data_type != 'f':
-                        # Check if it's not just whitespace
-                        if str(cell.value).strip() != "":
-                            has_non_formula_data = True
-                            break
-            
-            # If row has no non-formula data (either empty or only formulas), mark for deletion
-            if not has_non_formula_data:
-                rows_to_delete.append(row_idx)
-        
-        # Delete rows in reverse order to maintain row indices
+            if not is_blank(cell.value) and cell.data_type != 'f':
+                keep_rows.add(row_idx)
+        
+        # Data was just written, so read the current dimensions once here
+        max_row = target_ws.max_row
+        
+        # Rows without non-formula data (either empty or only formulas) are deleted
+        new_row_numbers = {}
         deleted_count = 0
-        for row_idx in reversed(rows_to_delete):
-            self.target_ws.delete_rows(row_idx, 1)
-            deleted_count += 1
+        for row_idx in range(1, max_row + 1):
+            if row_idx in keep_rows:
+                new_row_numbers[row_idx] = row_idx - deleted_count
+            else:
+                deleted_count += 1
+        
+        # Rebuild the cell dict once with every kept cell shifted up, the same result as
+        # delete_rows (formulas are not translated) without shifting all cells below per call
+        if deleted_count:
+            shifted_cells = {}
+            for (row_idx, col_idx), cell in cells.items():
+                new_row = new_row_numbers.get(row_idx)
+                if new_row is None:
+                    continue
+                cell.row = new_row
+                shifted_cells[(new_row, col_idx)] = cell
+            target_ws._cells = shifted_cells
+            target_ws._current_row = target_ws.max_row if shifted_cells else 0
         
         logger.debug(f"Cleaned up {deleted_count} empty/formula-only rows")
 
@@ -259,19 +460,24 @@ class ExcelFormatter:
         """Get input file headers mapping"""
         headers = {}
         
+        # Both detections start from the rightmost data column, scan for it once
+        rightmost_col = self.detect_rightmost_column(self.input_rows)
+        
         # Detect header row
-        input_header_row = self.detect_header_row(self.input_ws)
+        input_header_row = self.detect_header_row(self.input_rows, rightmost_col)
         logger.debug(f"Input header row detected: {input_header_row}")
         
         # Detect table end row
-        self.input_table_end_row = self.detect_table_end_row(self.input_ws, input_header_row)
+        self.input_table_end_row = self.detect_table_end_row(self.input_rows, input_header_row, rightmost_col)
         logger.debug(f"Input table end row detected: {self.input_table_end_row}")
         
+        header_values = self.input_rows[input_header_row - 1] if self.input_rows else ()
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        
         logger.debug("Input file headers:")
-        for col_idx in range(1, self.input_ws.max_column + 1):
-            cell = self.input_ws.cell(row=input_header_row, column=col_idx)
-            if cell.value:
-                raw_header = str(cell.value).strip()
+        for col_idx, value in enumerate(header_values, start=1):
+            if value:
+                raw_header = str(value).strip()
                 # NEW: Clean the header name
                 clean_header = clean_column_name(raw_header)
                 
@@ -279,11 +485,13 @@ class ExcelFormatter:
                     headers[clean_header] = col_idx
                     
                     # Log both raw and cleaned versions if they're different
+                    if not debug_enabled:
+                        continue
                     if raw_header != clean_header:
                         logger.debug(f"  Column {col_idx}: '{clean_header}' (cleaned from: '{raw_header[:50]}...')")
                     else:
                         logger.debug(f"  Column {col_idx}: '{clean_header}'")
-                else:
+                elif debug_enabled:
                     logger.debug(f"  Column {col_idx}: [EMPTY after cleaning] (raw: '{raw_header[:50]}...')")
         
         # Store the header row for later use
@@ -295,15 +503,18 @@ class ExcelFormatter:
         headers = []
         
         # Detect header row
-        target_header_row = self.detect_header_row(self.target_ws)
+        target_header_row = self.detect_header_row(self.target_rows)
         logger.debug(f"Target header row detected: {target_header_row}")
         
+        header_values = self.target_rows[target_header_row - 1] if self.target_rows else ()
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        
         logger.debug("Target format headers:")
-        for col_idx in range(1, self.target_ws.max_column + 1):
-            cell = self.target_ws.cell(row=target_header_row, column=col_idx)
-            header_value = str(cell.value).strip() if cell.value else ""
+        for col_idx, value in enumerate(header_values, start=1):
+            header_value = str(value).strip() if value else ""
             headers.append((header_value, col_idx))
-            logger.debug(f"  Column {col_idx}: '{header_value}'")
+            if debug_enabled:
+                logger.debug(f"  Column {col_idx}: '{header_value}'")
         
         # Store the header row for later use
         self.target_header_row = target_header_row
@@ -320,159 +531,266 @@ class ExcelFormatter:
         target_column_names = [header for header, _ in target_headers if header]
         logger.debug(f"Target columns needing data: {target_column_names}")
         
+        # Invert the mapping over the available input columns once: target column -> first
+        # (in header order) non-ignored input column that maps to it
+        input_for_target = {}
+        for input_col in input_headers:
+            if input_col in self.ignored_scanned:
+                continue
+            target_col = self.scanned_to_target.get(input_col)
+            if target_col is not None and target_col not in input_for_target:
+                input_for_target[target_col] = input_col
+        
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        
         # For each target column, find if any available input column maps to it
         for target_col in target_column_names:
-            found_mapping = False
-            
-            # Look through all available input columns
-            for input_col in input_headers.keys():
-                # Check if this input column is ignored
-                if input_col in self.ignored_scanned:
-                    logger.debug(f"  Skipping ignored input column '{input_col}'")
-                    continue
-                
-                # Check if this input column has a mapping to our target column
-                if input_col in self.scanned_to_target and self.scanned_to_target[input_col] == target_col:
-                    applicable_mappings[target_col] = input_col
+            input_col = input_for_target.get(target_col)
+            if input_col is not None:
+                applicable_mappings[target_col] = input_col
+                if debug_enabled:
                     logger.debug(f"  ✓ APPLICABLE: Target '{target_col}' <- Input '{input_col}' (found in file)")
-                    found_mapping = True
-                    break  # Use first available mapping for this target
-            
-            if not found_mapping:
+            elif debug_enabled:
                 logger.debug(f"  ✗ NO MAPPING: Target '{target_col}' - no available input column maps to it")
         
+        ignored_available = [input_col for input_col in input_headers if input_col in self.ignored_scanned]
+        if ignored_available:
+            logger.debug(f"Ignored input columns present in file: {ignored_available}")
+        
         logger.debug(f"=== FINAL APPLICABLE MAPPINGS: {len(applicable_mappings)} ===")
-        for target_col, input_col in applicable_mappings.items():
-            logger.debug(f"  '{target_col}' <- '{input_col}'")
+        if debug_enabled:
+            for target_col, input_col in applicable_mappings.items():
+                logger.debug(f"  '{target_col}' <- '{input_col}'")
         
         return applicable_mappings
     
     
 
-    def copy_cell_value_with_type_preservation(self, source_cell, target_cell):
-        """Copy cell value (never formulas) and data type from source to target"""
-        
-        # Get the actual value (never a formula)
-        source_value = source_cell.value
-        
-        # Extra safety check: if somehow a formula string got through, don't copy it
-        if isinstance(source_value, str) and source_value.startswith('='):
-            logger.warning(f"Detected formula string in source cell, skipping: {source_value[:50]}...")
-            return  # Don't copy formulas
-        
-        # Copy the calculated value with type preservation
-        if source_cell.data_type == 'd':  # Date
-            target_cell.value = source_value
-        elif source_cell.data_type == 'n':  # Number
-            target_cell.value = source_value
-        elif source_cell.data_type == 'b':  # Boolean
-            target_cell.value = source_value
-        else:  # String or other (but not formula since we loaded with data_only=True)
-            target_cell.value = source_value
-        
-        # Copy number format to preserve data type appearance (but not if it's a formula format)
-        if source_cell.number_format and source_cell.number_format != 'General':
-            target_cell.number_format = source_cell.number_format
-        
-        # Log what we're copying for debugging
-        if source_value is not None:
-            logger.debug(f"Copied value: {source_value} (type: {source_cell.data_type})")
-    
-    def process_column_with_mapping(self, target_col_idx: int, target_header: str, 
-                           input_column: str, input_headers: Dict[str, int]):
-        """Process a column that has data mapping"""
-        logger.debug(f"Processing column '{target_header}' mapped from '{input_column}'")
-        
-        input_col_idx = input_headers[input_column]
-        logger.debug(f"Input column '{input_column}' is at index {input_col_idx}")
-        
+    def build_column_plan(self, input_headers: Dict[str, int], target_headers: List[Tuple[str, int]],
+                          applicable_mappings: Dict[str, str]) -> List[Tuple[int, int]]:
+        """Resolve every mapped target column to (target column index, input column index) once"""
+        return [
+            (col_idx, input_headers[applicable_mappings[header_name]])
+            for header_name, col_idx in target_headers
+            if header_name in applicable_mappings
+        ]
+
+    def process_mapped_columns(self, column_plan: List[Tuple[int, int]]):
+        """Copy all mapped columns in a single row-major pass over the input rows.
+        Every target cell up to the last input row is written, formula cells as None,
+        so these columns need no separate clearing"""
         # Get the maximum row with data in input file
-        max_input_row = self.input_ws.max_row
+        max_input_row = self.input_max_row
         
         # Process each data row from input file (starting after header row)
         rows_processed = 0
         cells_copied = 0
         formulas_skipped = 0  # Track skipped formulas
+        blank_rows = 0
         input_data_start_row = self.input_header_row + 1
         target_data_start_row = self.target_header_row + 1
+        row_offset = target_data_start_row - input_data_start_row
         
         logger.debug(f"Processing rows from input row {input_data_start_row} to {max_input_row}")
-        logger.debug(f"Mapping to target starting at row {target_data_start_row}")
+        logger.debug(f"Mapping {len(column_plan)} columns to target starting at row {target_data_start_row}")
+        
+        row_has_data = self.input_row_has_data
+        input_rows = self.input_rows
+        input_number_formats = self.input_number_formats
+        target_cell = self.target_ws.cell
+        mark_row_with_data = self.target_rows_with_data.add
+        
+        # Only input columns with at least one non-General format need a per-cell lookup
+        formatted_cols = {col_idx for _, col_idx in input_number_formats}
         
         for input_row_idx in range(input_data_start_row, max_input_row + 1):
-            # Calculate corresponding target row
-            target_row_idx = target_data_start_row + (input_row_idx - input_data_start_row)
+            target_row_idx = input_row_idx + row_offset
+            input_row = input_rows[input_row_idx - 1]
+            row_width = len(input_row)
             
-            input_cell = self.input_ws.cell(row=input_row_idx, column=input_col_idx)
-            target_cell = self.target_ws.cell(row=target_row_idx, column=target_col_idx)
+            # Blank input rows are still copied, they can carry whitespace values and number formats
+            if not row_has_data[input_row_idx - 1]:
+                blank_rows += 1
             
-            # Additional safety check for formulas
-            input_value = input_cell.value
-            if isinstance(input_value, str) and input_value.startswith('='):
-                logger.warning(f"Skipping formula at input[{input_row_idx},{input_col_idx}]: {input_value[:30]}...")
-                formulas_skipped += 1
-                continue
-            
-            # Log what we're copying (only non-empty, non-formula values)
-            if input_value is not None and str(input_value).strip() != "":
-                logger.debug(f"Copying from input[{input_row_idx},{input_col_idx}] = '{input_value}' to target[{target_row_idx},{target_col_idx}]")
-                cells_copied += 1
-            
-            # Copy data (this method now has additional formula protection)
-            self.copy_cell_value_with_type_preservation(input_cell, target_cell)
+            for target_col_idx, input_col_idx in column_plan:
+                input_value = input_row[input_col_idx - 1] if input_col_idx <= row_width else None
+                
+                # Additional safety check for formulas
+                if isinstance(input_value, str) and input_value.startswith('='):
+                    logger.warning(f"Skipping formula at input[{input_row_idx},{input_col_idx}]: {input_value[:30]}...")
+                    formulas_skipped += 1
+                    target_cell(row=target_row_idx, column=target_col_idx).value = None
+                    continue
+                
+                cell = target_cell(row=target_row_idx, column=target_col_idx)
+                
+                # Count non-empty, non-formula values, logged once after the loop
+                if not is_blank(input_value):
+                    cells_copied += 1
+                    mark_row_with_data(target_row_idx)
+                
+                # Values come from a data_only workbook, so they are already the calculated values
+                # and keep their type (date, number, boolean, string)
+                cell.value = input_value
+                
+                # Copy number format to preserve data type appearance, General is never stored
+                if input_col_idx in formatted_cols:
+                    number_format = input_number_formats.get((input_row_idx, input_col_idx))
+                    if number_format:
+                        cell.number_format = number_format
             rows_processed += 1
         
         if formulas_skipped > 0:
-            logger.warning(f"Skipped {formulas_skipped} formula cells in column '{target_header}'")
+            logger.warning(f"Skipped {formulas_skipped} formula cells in mapped columns")
         
-        logger.debug(f"Processed {rows_processed} rows for column '{target_header}', copied {cells_copied} non-empty cells")
+        logger.debug(f"Processed {rows_processed} rows ({blank_rows} blank), copied {cells_copied} non-empty cells")
 
-    def clear_column_data(self, col_idx: int, max_row: int):
-        """Clear data in a column"""
-        cleared_cells = 0
-        target_data_start_row = self.target_header_row + 1
+    def detect_nonempty_rows(self, rows: List[tuple]) -> List[bool]:
+        """Flag every row that has at least one non-empty cell (index 0 is row 1)"""
+        return [
+            any(not is_blank(value) for value in row)
+            for row in rows
+        ]
+
+    def clear_columns_data(self, clear_from_rows: Dict[int, int], max_row: int):
+        """Clear data in several columns at once, each from its own first row (column index -> row)
+        down to max_row. Only cells that exist are touched, in a single sweep of the sheet's cells"""
+        cleared_counts = {}
         
-        for row_idx in range(target_data_start_row, max_row + 1):
-            cell = self.target_ws.cell(row=row_idx, column=col_idx)
-            cell.value = None
-            cleared_cells += 1
+        # Missing cells are already empty, so walk the sparse cell dict instead of creating
+        # a cell for every (row, column) in the range
+        for (row_idx, col_idx), cell in self.target_ws._cells.items():
+            min_row = clear_from_rows.get(col_idx)
+            if min_row is None or not min_row <= row_idx <= max_row:
+                continue
+            # Merged cells have no value of their own and cannot be assigned
+            if cell.value is not None:
+                cell.value = None
+                cleared_counts[col_idx] = cleared_counts.get(col_idx, 0) + 1
         
-        if cleared_cells > 0:
-            col_letter = get_column_letter(col_idx)
-            logger.debug(f"Cleared {cleared_cells} cells in column {col_letter}")
+        if logger.isEnabledFor(logging.DEBUG):
+            for col_idx, cleared_cells in sorted(cleared_counts.items()):
+                logger.debug(f"Cleared {cleared_cells} cells in column {self.col_letters[col_idx]}")
 
-    def detect_header_row(self, worksheet) -> int:
+    def detect_header_row(self, rows: List[tuple], rightmost_col: int = None) -> int:
         """Detect header row using the strategy: find rightmost column with data, 
         then find first row with data in that column"""
         
-        if worksheet.max_row == 0:
+        if not rows:
             return 1  # Default to row 1 if no data
         
         # Find the rightmost column with data across all rows
-        rightmost_col = 0
-        for row_idx in range(1, worksheet.max_row + 1):
-            for col_idx in range(worksheet.max_column, 0, -1):
-                cell = worksheet.cell(row=row_idx, column=col_idx)
-                if cell.value is not None and str(cell.value).strip() != "":
-                    if col_idx > rightmost_col:
-                        rightmost_col = col_idx
-                    break  # Found the rightmost data in this row
+        if rightmost_col is None:
+            rightmost_col = self.detect_rightmost_column(rows)
         
         if rightmost_col == 0:
             return 1  # Default to row 1 if no data
         
         # Now find the first row that has data in the rightmost column
-        for row_idx in range(1, worksheet.max_row + 1):
-            cell = worksheet.cell(row=row_idx, column=rightmost_col)
-            if cell.value is not None and str(cell.value).strip() != "":
-                return row_idx
+        for row_idx, row in enumerate(rows, start=1):
+            if rightmost_col <= len(row):
+                value = row[rightmost_col - 1]
+                if not is_blank(value):
+                    return row_idx
         
         return 1  # Default to row 1 if not found
 
+    def styled_write_only_cell(self, output_ws, source_cell) -> WriteOnlyCell:
+        """Copy a template cell with its style into a write-only sheet"""
+        cell = WriteOnlyCell(output_ws, value=source_cell.value)
+        cell.font = copy(source_cell.font)
+        cell.fill = copy(source_cell.fill)
+        cell.border = copy(source_cell.border)
+        cell.alignment = copy(source_cell.alignment)
+        cell.number_format = source_cell.number_format
+        return cell
+
+    def build_streamed_output(self, input_headers: Dict[str, int], target_headers: List[Tuple[str, int]],
+                              applicable_mappings: Dict[str, str]) -> Workbook:
+        """Build the output as a write-only workbook, appending the template header area and
+        then one row per input data row"""
+        output_wb = Workbook(write_only=True)
+        output_ws = output_wb.create_sheet(self.target_sheet_name)
+        
+        def has_non_formula_data(values) -> bool:
+            for value in values:
+                if isinstance(value, str) and value.startswith('='):
+                    continue
+                if not is_blank(value):
+                    return True
+            return False
+        
+        # Template rows up to the header row, formula-only and empty ones follow the cleanup setting.
+        # Styled cells are re-created as WriteOnlyCell so header fonts, fills and borders survive
+        template_rows = self.target_ws.iter_rows(max_row=self.target_header_row)
+        for row_idx, (values, cells) in enumerate(zip(self.target_rows, template_rows), start=1):
+            if (self.clean_formula_only_rows and row_idx != self.target_header_row
+                    and not has_non_formula_data(values)):
+                continue
+            output_ws.append([
+                self.styled_write_only_cell(output_ws, cell) if getattr(cell, 'has_style', False) else cell.value
+                for cell in cells
+            ])
+        
+        column_plan = self.build_column_plan(input_headers, target_headers, applicable_mappings)
+        row_width = max((col_idx for col_idx, _ in column_plan), default=0)
+        input_number_formats = self.input_number_formats
+        formatted_cols = {col_idx for _, col_idx in input_number_formats}
+        
+        # Bind the per-row lookups to locals once, this loop runs for every input row
+        input_rows = self.input_rows
+        row_has_data = self.input_row_has_data
+        clean_rows = self.clean_formula_only_rows
+        append_row = output_ws.append
+        
+        rows_written = 0
+        for input_row_idx in range(self.input_header_row + 1, self.input_max_row + 1):
+            values = [None] * row_width
+            formatted = []  # (target column, number format) of cells needing a styled cell
+            # Blank input rows are dropped by the cleanup, otherwise they keep their
+            # whitespace values and number formats like any other row
+            if clean_rows and not row_has_data[input_row_idx - 1]:
+                continue
+            input_row = input_rows[input_row_idx - 1]
+            row_len = len(input_row)
+            for col_idx, input_col_idx in column_plan:
+                value = input_row[input_col_idx - 1] if input_col_idx <= row_len else None
+                # Never copy formulas
+                if isinstance(value, str) and value.startswith('='):
+                    continue
+                values[col_idx - 1] = value
+                
+                # Plain values are enough unless the input cell carries a number format
+                if input_col_idx in formatted_cols:
+                    number_format = input_number_formats.get((input_row_idx, input_col_idx))
+                    if number_format:
+                        formatted.append((col_idx, number_format))
+            
+            if clean_rows and not has_non_formula_data(values):
+                continue
+            
+            for col_idx, number_format in formatted:
+                cell = WriteOnlyCell(output_ws, value=values[col_idx - 1])
+                cell.number_format = number_format
+                values[col_idx - 1] = cell
+            append_row(values)
+            rows_written += 1
+        
+        logger.debug(f"Streamed {rows_written} data rows into output sheet '{self.target_sheet_name}'")
+        return output_wb
+
+    def copy_to_problematic(self) -> Path:
+        """Mirror the input file into the problematic directory, at most once per formatter"""
+        if not self.problematic_copied:
+            PROBLEMATIC_DIR.mkdir(parents=True, exist_ok=True)
+            mirror_file(self.input_file, str(self.problematic_path))
+            self.problematic_copied = True
+        return self.problematic_path
+
     def format_excel(self):
         """Main formatting function"""
         try:
-            logger.info(f"Starting Excel formatting for {os.path.basename(self.input_file)}")
+            logger.info(f"Starting Excel formatting for {self.input_basename}")
             self.load_files()
             
             # Initialize header row variables
@@ -482,6 +800,9 @@ class ExcelFormatter:
             input_headers = self.get_input_headers()
             target_headers = self.get_target_headers()
             
+            # Find blank input rows once so column processing can skip them
+            self.input_row_has_data = self.detect_nonempty_rows(self.input_rows)
+            
             logger.debug(f"Found {len(input_headers)} input headers and {len(target_headers)} target headers")
             logger.debug(f"Total configured mappings: {len(self.scanned_to_target)}")
             
@@ -489,90 +810,96 @@ class ExcelFormatter:
             applicable_mappings = self.find_applicable_mappings(input_headers, target_headers)
             logger.debug(f"Applicable mappings for this file: {len(applicable_mappings)}")
             
-            # Calculate maximum data row from input file
-            max_input_data_row = self.input_ws.max_row
+            if self.stream_output:
+                # Template was opened read-only, rows go straight into a new write-only workbook
+                output_wb = self.build_streamed_output(input_headers, target_headers, applicable_mappings)
+            else:
+                # Calculate maximum data row from input file
+                max_input_data_row = self.input_max_row
             
-            # Calculate how many data rows we need in target
-            input_data_rows = max_input_data_row - self.input_header_row
-            target_max_needed_row = self.target_header_row + input_data_rows
+                # Calculate how many data rows we need in target
+                input_data_rows = max_input_data_row - self.input_header_row
+                target_max_needed_row = self.target_header_row + input_data_rows
             
-            # Extend target worksheet if needed
-            max_target_row = max(self.target_ws.max_row, target_max_needed_row)
+                # Extend target worksheet if needed
+                max_target_row = max(self.target_max_row, target_max_needed_row)
             
-            logger.debug(f"Input header row: {self.input_header_row}, Target header row: {self.target_header_row}")
-            logger.debug(f"Max input data row: {max_input_data_row}, Max target row needed: {target_max_needed_row}")
+                logger.debug(f"Input header row: {self.input_header_row}, Target header row: {self.target_header_row}")
+                logger.debug(f"Max input data row: {max_input_data_row}, Max target row needed: {target_max_needed_row}")
             
-            # First, clear all data in target (prepare for fresh data import)
-            for header_name, col_idx in target_headers:
-                if not header_name:  # Skip empty headers
-                    continue
-                self.clear_column_data(col_idx, max_target_row)
-            
-            # Process each target column using applicable mappings
-            processed_columns = 0
-            mapped_columns = 0
-            skipped_columns = 0
-
-            for header_name, col_idx in target_headers:
-                if not header_name:  # Skip empty headers
-                    continue
-                    
-                col_letter = get_column_letter(col_idx)
-                processed_columns += 1
+                column_plan = self.build_column_plan(input_headers, target_headers, applicable_mappings)
+                mapped_col_indices = {col_idx for col_idx, _ in column_plan}
                 
-                logger.debug(f"Processing target column '{header_name}' (Column {col_letter})")
+                # First, clear all data in target (prepare for fresh data import).
+                # Mapped columns are overwritten up to the last input row, only their tail is cleared
+                target_data_start_row = self.target_header_row + 1
+                clear_from_rows = {}
+                for header_name, col_idx in target_headers:
+                    if not header_name:  # Skip empty headers
+                        continue
+                    if col_idx in mapped_col_indices:
+                        clear_from_rows[col_idx] = target_max_needed_row + 1
+                    else:
+                        clear_from_rows[col_idx] = target_data_start_row
+                self.clear_columns_data(clear_from_rows, max_target_row)
+            
+                # Partition named target columns into mapped and unmapped ones, logged once
+                named_columns = [(header_name, col_idx) for header_name, col_idx in target_headers if header_name]
+                unmapped_columns = [header_name for header_name, col_idx in named_columns
+                                    if col_idx not in mapped_col_indices]
+                processed_columns = len(named_columns)
+                mapped_columns = processed_columns - len(unmapped_columns)
+                skipped_columns = len(unmapped_columns)
                 
-                if header_name in applicable_mappings:
-                    # Column has applicable mapping
-                    mapped_columns += 1
-                    input_column = applicable_mappings[header_name]
-                    logger.debug(f"Applying data mapping for {col_letter}: '{header_name}' <- '{input_column}'")
-                    self.process_column_with_mapping(
-                        col_idx, header_name, input_column, input_headers
+                if logger.isEnabledFor(logging.DEBUG):
+                    mapped_summary = ", ".join(
+                        f"{self.col_letters[col_idx]}: '{header_name}' <- '{applicable_mappings[header_name]}'"
+                        for header_name, col_idx in named_columns if col_idx in mapped_col_indices
                     )
-                else:
-                    # No applicable mapping found
-                    logger.debug(f"No applicable mapping found for '{header_name}' - leaving empty")
-                    skipped_columns += 1
+                    logger.debug(f"Applying data mappings: {mapped_summary}")
+                    logger.debug(f"No applicable mapping found for {unmapped_columns} - leaving empty")
 
-            logger.debug(f"Data mapping complete - Processed: {processed_columns}, Mapped: {mapped_columns}, Skipped: {skipped_columns}")
-            
-            # Clean formula-only and empty rows
-            self.clean_formula_only_rows_func()
+                # Copy every mapped column in a single pass over the input rows
+                self.process_mapped_columns(column_plan)
+                
+                logger.debug(f"Data mapping complete - Processed: {processed_columns}, Mapped: {mapped_columns}, Skipped: {skipped_columns}")
             
-            logger.debug(f"Summary - Processed: {processed_columns}, Mapped: {mapped_columns}, Errors: {len(self.error_messages)}")
+                # Clean formula-only and empty rows
+                self.clean_formula_only_rows_func()
             
+                logger.debug(f"Summary - Processed: {processed_columns}, Mapped: {mapped_columns}, Errors: {len(self.error_messages)}")
+                output_wb = self.target_wb
+
+            # All data has been copied, release the input value grid before the output is serialised
+            self.input_rows = None
+            self.input_row_has_data = None
+            self.input_number_formats = None
+
             # Handle errors
             if self.error_messages:
                 for msg in self.error_messages:
                     logger.error(msg)
                 
                 # Copy to problematic directory
-                problematic_dir = Path("data/problematic")
-                problematic_dir.mkdir(parents=True, exist_ok=True)
-                problematic_path = problematic_dir / os.path.basename(self.input_file)
-                shutil.copy2(self.input_file, problematic_path)
+                self.copy_to_problematic()
                 
-                raise Exception("Formatting failed due to errors")
+                raise FormatError("Formatting failed due to errors")
             
             # Save the result
-            self.target_wb.save(self.output_file)
+            output_wb.save(self.output_file)
             logger.info(f"Successfully formatted and saved to: {self.output_file}")
             safe_print(f"Successfully formatted and saved to: {self.output_file}")
             
         except Exception as e:
             logger.error(f"Formatting failed: {e}")
             if self.error_messages:
-                # Copy to problematic directory on error
-                problematic_dir = Path("data/problematic")
-                problematic_dir.mkdir(parents=True, exist_ok=True)
-                problematic_path = problematic_dir / os.path.basename(self.input_file)
-                shutil.copy2(self.input_file, problematic_path)
+                # Copy to problematic directory on error (skipped if already copied above)
+                problematic_path = self.copy_to_problematic()
                 logger.info(f"Copied problematic file to: {problematic_path}")
             raise e
         finally:
             # Clean up
-            if self.input_wb:
+            if self.input_wb and self.owns_input_wb:
                 self.input_wb.close()
             if self.target_wb:
                 self.target_wb.close()
@@ -580,91 +907,283 @@ class ExcelFormatter:
 
 def format_single_file(input_file: str, target_file: str, mapping_file: str, 
                       output_file: str, input_sheet: str, target_sheet: str, 
-                      table_end_tolerance: int = 1, clean_formula_only_rows: bool = True):
+                      table_end_tolerance: int = 1, clean_formula_only_rows: bool = True,
+                      input_wb=None, stream_output: bool = False,
+                      mapping_config: dict = None, target_bytes: bytes = None,
+                      strict_dimensions: bool = False):
     formatter = ExcelFormatter(input_file, target_file, mapping_file, 
                               output_file, input_sheet, target_sheet, 
-                              table_end_tolerance, clean_formula_only_rows)
+                              table_end_tolerance, clean_formula_only_rows,
+                              input_wb, stream_output, mapping_config, target_bytes,
+                              strict_dimensions)
     formatter.format_excel()
 
 
+# Inputs of a pool worker process shared by all its sheets, set once by _init_sheet_worker
+_worker_input_wb = None
+_worker_mapping_config = None
+_worker_target_bytes = None
+
+
+def _init_sheet_worker(input_file: str, mapping_config: dict, target_bytes: bytes):
+    """Parse the input workbook once per worker process and keep the preloaded mapping and target"""
+    global _worker_input_wb, _worker_mapping_config, _worker_target_bytes
+    _worker_input_wb = load_input_workbook(input_file)
+    _worker_mapping_config = mapping_config
+    _worker_target_bytes = target_bytes
+
+
+def _format_sheet_worker(input_file: str, target_file: str, mapping_file: str,
+                         output_file: str, input_sheet: str, target_sheet: str,
+                         table_end_tolerance: int, clean_formula_only_rows: bool,
+                         stream_output: bool, strict_dimensions: bool):
+    """Format one sheet inside a pool worker using its shared input workbook"""
+    logger.info(f"Processing sheet: {input_sheet}")
+    format_single_file(input_file, target_file, mapping_file,
+                       output_file, input_sheet, target_sheet,
+                       table_end_tolerance, clean_formula_only_rows,
+                       _worker_input_wb, stream_output,
+                       _worker_mapping_config, _worker_target_bytes,
+                       strict_dimensions)
+
+
+def report_sheet_result(input_file: str, sheet_name: str, error: Exception = None,
+                        problematic_copied: set = None):
+    """Print the per-sheet outcome of format_all_sheets, problematic_copied holds the
+    problematic copies already made in this run"""
+    if error is None:
+        safe_print(f"✓ Format successful for sheet: {sheet_name}")
+        return
+    
+    logger.error(f"Error processing sheet {sheet_name}: {error}")
+    safe_print(f"❌ Error for sheet {sheet_name}: {error}")
+    
+    # Failed sheets are copied here, the formatter only copies the file itself for collected
+    # error messages. Copy once per run and replace whatever an earlier run left behind
+    problematic_path = PROBLEMATIC_DIR / os.path.basename(input_file)
+    if problematic_copied is None or problematic_path not in problematic_copied:
+        PROBLEMATIC_DIR.mkdir(parents=True, exist_ok=True)
+        mirror_file(input_file, str(problematic_path))
+        if problematic_copied is not None:
+            problematic_copied.add(problematic_path)
+    safe_print(f"Problematic file copied to: {problematic_path}")
+
+
 def format_all_sheets(input_file: str, target_file: str, mapping_file: str, target_sheet: str, 
-                     table_end_tolerance: int = 1, clean_formula_only_rows: bool = True):
-    """Format all sheets in an Excel file"""
-    # Validate input files
+                     table_end_tolerance: int = 1, clean_formula_only_rows: bool = True,
+                     max_workers: int = None, stream_output: bool = False,
+                     strict_dimensions: bool = False, skip_up_to_date: bool = False,
+                     max_failures: int = None):
+    """Format all sheets in an Excel file, in parallel worker processes when there are several sheets.
+    With skip_up_to_date, sheets whose output is newer than the input, target and mapping files
+    are left alone (only valid when re-running with the same settings).
+    With max_failures, the run stops once more than that many sheets have failed"""
+    # Validate input files, keeping the stat results for the up-to-date check
+    source_stats = {}
     for file_path in [input_file, target_file, mapping_file]:
-        if not os.path.exists(file_path):
-            raise Exception(f"File not found: {file_path}")
+        try:
+            source_stats[file_path] = os.stat(file_path)
+        except OSError:
+            raise InputError(f"File not found: {file_path}")
     
     # Create results directory
-    results_dir = Path("data/results")
-    results_dir.mkdir(parents=True, exist_ok=True)
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
     
     # Get all sheet names from input file
-    input_wb = load_workbook(input_file, read_only=True)
-    input_sheets = input_wb.sheetnames
-    input_wb.close()
+    input_sheets = read_sheet_names(input_file)
     
     if not input_sheets:
-        raise Exception("No sheets found in input file")
+        raise InputError("No sheets found in input file")
     
     logger.info(f"Processing {len(input_sheets)} sheets from {os.path.basename(input_file)}")
     
-    # Process each sheet
+    # Mapping and target file are the same for every sheet, read them only once
+    mapping_config = load_mapping_config(mapping_file)
+    with open(target_file, 'rb') as f:
+        target_bytes = f.read()
+    
     input_filename = Path(input_file).stem
+    output_prefix = f"{RESULTS_DIR}{os.sep}{input_filename}-"
+    sheet_outputs = [
+        (sheet_name, f"{output_prefix}{sheet_name}.xlsx")
+        for sheet_name in input_sheets
+    ]
     
-    for sheet_name in input_sheets:
-        output_filename = f"{input_filename}-{sheet_name}.xlsx"
-        output_file = results_dir / output_filename
-        
+    if skip_up_to_date:
+        source_mtime_ns = max(stat.st_mtime_ns for stat in source_stats.values())
+        # One directory listing instead of a stat per expected output
+        with os.scandir(RESULTS_DIR) as entries:
+            existing_mtimes = {entry.path: entry.stat().st_mtime_ns for entry in entries if entry.is_file()}
+        pending_outputs = []
+        for sheet_name, output_file in sheet_outputs:
+            up_to_date = existing_mtimes.get(output_file, -1) >= source_mtime_ns
+            if up_to_date:
+                safe_print(f"Skipping sheet {sheet_name} (output is up to date)")
+            else:
+                pending_outputs.append((sheet_name, output_file))
+        sheet_outputs = pending_outputs
+        if not sheet_outputs:
+            return
+    
+    # Every output is a copy of the template plus data, fail before formatting anything
+    # rather than running out of disk space halfway through
+    expected_output_bytes = source_stats[target_file].st_size * len(sheet_outputs)
+    free_bytes = shutil.disk_usage(RESULTS_DIR).free
+    if free_bytes < expected_output_bytes * 1.5:
+        raise DiskSpaceError(f"Not enough disk space for {len(sheet_outputs)} outputs in {RESULTS_DIR}: "
+                             f"{free_bytes} bytes free, about {expected_output_bytes} needed")
+    
+    # Sheets are independent, openpyxl is CPU bound so use processes rather than threads
+    if max_workers is None:
+        max_workers = min(len(sheet_outputs), os.cpu_count() or 1)
+    
+    succeeded = 0
+    failures = []  # (sheet name, error message)
+    problematic_copied = set()  # Problematic copies made by this run
+    
+    def too_many_failures() -> bool:
+        # Failing this often usually means the template or mapping is broken, the
+        # remaining sheets would fail the same way
+        return max_failures is not None and len(failures) > max_failures
+    
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_sheet_worker,
+                                 initargs=(input_file, mapping_config, target_bytes)) as executor:
+            futures = {
+                executor.submit(_format_sheet_worker, input_file, target_file, mapping_file,
+                                output_file, sheet_name, target_sheet,
+                                table_end_tolerance, clean_formula_only_rows,
+                                stream_output, strict_dimensions): sheet_name
+                for sheet_name, output_file in sheet_outputs
+            }
+            for future in as_completed(futures):
+                sheet_name = futures[future]
+                try:
+                    future.result()
+                    report_sheet_result(input_file, sheet_name)
+                    succeeded += 1
+                except Exception as e:
+                    report_sheet_result(input_file, sheet_name, e, problematic_copied)
+                    failures.append((sheet_name, str(e)))
+                    if too_many_failures():
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        break
+    else:
+        # Single worker: parse input file once and share it across all sheets
+        input_wb = load_input_workbook(input_file)
         try:
-            logger.info(f"Processing sheet: {sheet_name}")
-            format_single_file(
-                input_file, target_file, mapping_file,
-                str(output_file), sheet_name, target_sheet, 
-                table_end_tolerance, clean_formula_only_rows
-            )
-            safe_print(f"✓ Format successful for sheet: {sheet_name}")
-        except Exception as e:
-            logger.error(f"Error processing sheet {sheet_name}: {e}")
-            safe_print(f"❌ Error for sheet {sheet_name}: {e}")
-            safe_print(f"Problematic file copied to: data/problematic/{os.path.basename(input_file)}")
-
-def main():
-    """Main entry point for command line usage"""
-    if len(sys.argv) < 5:
-        safe_print("Usage: python format_excel.py <input_file> <target_file> <mapping_file> <target_sheet> [table_end_tolerance] [clean_formula_only_rows] [output_file] [input_sheet]")
-        safe_print("  If output_file is not provided, will format all sheets")
-        sys.exit(1)
+            for sheet_name, output_file in sheet_outputs:
+                try:
+                    logger.info(f"Processing sheet: {sheet_name}")
+                    format_single_file(
+                        input_file, target_file, mapping_file,
+                        output_file, sheet_name, target_sheet, 
+                        table_end_tolerance, clean_formula_only_rows,
+                        input_wb, stream_output, mapping_config, target_bytes,
+                        strict_dimensions
+                    )
+                    report_sheet_result(input_file, sheet_name)
+                    succeeded += 1
+                except Exception as e:
+                    report_sheet_result(input_file, sheet_name, e, problematic_copied)
+                    failures.append((sheet_name, str(e)))
+                    if too_many_failures():
+                        break
+        finally:
+            input_wb.close()
     
-    input_file = sys.argv[1]
-    target_file = sys.argv[2]
-    mapping_file = sys.argv[3]
-    target_sheet = sys.argv[4]
+    # One summary for the whole run, so a systemic problem is not buried in per-sheet errors
+    logger.info(f"Formatted {succeeded} of {len(sheet_outputs)} sheets, {len(failures)} failed")
+    if failures:
+        for sheet_name, error in failures:
+            logger.error(f"  {sheet_name}: {error}")
+        if succeeded + len(failures) < len(sheet_outputs):
+            safe_print(f"Stopped after {len(failures)} failed sheets, "
+                       f"{len(sheet_outputs) - succeeded - len(failures)} sheets were not processed")
+
+def split_options(parser: argparse.ArgumentParser, argv: List[str]) -> List[str]:
+    """Move the parser's own options in front of a '--' so every other token is positional.
+    Sheet names and paths may start with '-' (e.g. '-2023'), argparse would take them for options"""
+    takes_value = {option: action.nargs != 0
+                   for action in parser._actions for option in action.option_strings}
+    options, positionals = [], []
+    tokens = iter(argv)
+    for token in tokens:
+        if token == '--':
+            positionals.extend(tokens)
+            break
+        name = token.split('=', 1)[0]
+        if name not in takes_value:
+            positionals.append(token)
+            continue
+        options.append(token)
+        if takes_value[name] and '=' not in token:
+            # The option's value, argparse reports it as missing if the command line ends here
+            value = next(tokens, None)
+            if value is not None:
+                options.append(value)
+    return options + ['--'] + positionals
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line arguments, the positional order is what the Go side passes"""
+    parser = argparse.ArgumentParser(
+        description="Format Excel sheets into a target template. "
+                    "If output_file is not provided, will format all sheets",
+        allow_abbrev=False)
+    parser.add_argument("input_file")
+    parser.add_argument("target_file")
+    parser.add_argument("mapping_file")
+    parser.add_argument("target_sheet")
+    parser.add_argument("table_end_tolerance", nargs="?", default="1")
+    parser.add_argument("clean_formula_only_rows", nargs="?", default="true")
+    parser.add_argument("output_file", nargs="?")
+    parser.add_argument("input_sheet", nargs="?")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="worker processes for formatting all sheets (default: one per sheet, up to CPU count)")
+    parser.add_argument("--stream-output", action="store_true",
+                        help="write a streamed output holding only the target sheet's header area and data")
+    parser.add_argument("--strict-dimensions", action="store_true",
+                        help="trust the dimensions stored in the workbooks instead of resetting them")
+    parser.add_argument("--skip-up-to-date", action="store_true",
+                        help="skip sheets whose output is newer than all input files")
+    parser.add_argument("--max-failures", type=int, default=None,
+                        help="stop formatting once more than this many sheets have failed")
+    args = parser.parse_args(split_options(parser, sys.argv[1:] if argv is None else argv))
     
     # Parse table_end_tolerance parameter
-    table_end_tolerance = 1  # default
-    if len(sys.argv) >= 6:
-        try:
-            table_end_tolerance = int(sys.argv[5])
-        except ValueError:
-            safe_print(f"Invalid table_end_tolerance value: {sys.argv[5]}, using default 1")
+    try:
+        args.table_end_tolerance = int(args.table_end_tolerance)
+    except ValueError:
+        safe_print(f"Invalid table_end_tolerance value: {args.table_end_tolerance}, using default 1")
+        args.table_end_tolerance = 1
     
     # Parse clean_formula_only_rows parameter
-    clean_formula_only_rows = True  # default
-    if len(sys.argv) >= 7:
-        clean_formula_only_rows = sys.argv[6].lower() == "true"
+    args.clean_formula_only_rows = args.clean_formula_only_rows.lower() == "true"
+    
+    return args
+
+
+def main():
+    """Main entry point for command line usage"""
+    args = parse_args()
     
-    if len(sys.argv) >= 9:
+    if args.output_file and args.input_sheet:
         # Single file format
-        output_file = sys.argv[7]
-        input_sheet = sys.argv[8]
-        format_single_file(input_file, target_file, mapping_file, 
-                          output_file, input_sheet, target_sheet, 
-                          table_end_tolerance, clean_formula_only_rows)
+        format_single_file(args.input_file, args.target_file, args.mapping_file,
+                          args.output_file, args.input_sheet, args.target_sheet,
+                          args.table_end_tolerance, args.clean_formula_only_rows,
+                          stream_output=args.stream_output,
+                          strict_dimensions=args.strict_dimensions)
     else:
         # Format all sheets
-        format_all_sheets(input_file, target_file, mapping_file, target_sheet, 
-                         table_end_tolerance, clean_formula_only_rows)
+        format_all_sheets(args.input_file, args.target_file, args.mapping_file, args.target_sheet,
+                         args.table_end_tolerance, args.clean_formula_only_rows,
+                         max_workers=args.jobs, stream_output=args.stream_output,
+                         strict_dimensions=args.strict_dimensions,
+                         skip_up_to_date=args.skip_up_to_date,
+                         max_failures=args.max_failures)
 
 
 if __name__ == "__main__":